@@ -1,11 +1,3 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 import os
 import discord
@@ -15,6 +7,9 @@ import traceback
 import time
 import sqlite3
 import json
+import hashlib
+import threading
+from scheduler import ScrapeScheduler, INTERACTIVE, BACKGROUND
 
 # Intents
 intents = discord.Intents.default()
@@ -33,6 +28,19 @@ users_in_setup = set()
 # Database configuration
 DB_PATH = "grades_bot.db"
 
+# How often the background sweep checks every user for new grades
+SWEEP_INTERVAL_MINUTES = 10
+
+# Path to chromedriver, resolved on first scrape
+chromedriver_path = None
+chromedriver_lock = threading.Lock()
+
+# Scrape threads: the sweep checks one user at a time to keep portal and Chrome load down,
+# and user commands get their own threads on top so they never wait behind the sweep
+SWEEP_WORKERS = 1
+INTERACTIVE_RESERVED_WORKERS = 2
+scrape_scheduler = ScrapeScheduler(SWEEP_WORKERS, INTERACTIVE_RESERVED_WORKERS)
+
 # Connect to SQLite database
 def get_db_connection():
     conn = sqlite3.connect(DB_PATH)
@@ -60,11 +68,43 @@ def init_db():
     )
     ''')
 
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+
     conn.commit()
     conn.close()
     print("Database initialized successfully")
 
 
+# Get a persisted bot state value (None if unset)
+def get_state(key):
+    conn = get_db_connection()
+    row = conn.execute("SELECT value FROM bot_state WHERE key = ?", (key,)).fetchone()
+    conn.close()
+
+    if row:
+        return row["value"]
+    return None
+
+
+# Persist a bot state value, or clear it when value is None
+def set_state(key, value):
+    conn = get_db_connection()
+    if value is None:
+        conn.execute("DELETE FROM bot_state WHERE key = ?", (key,))
+    else:
+        conn.execute(
+            "INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)",
+            (key, str(value))
+        )
+    conn.commit()
+    conn.close()
+
+
 # Save user credentials to database
 def save_credentials(user_id, email, password):
     conn = get_db_connection()
@@ -121,6 +161,8 @@ def delete_user_data(user_id):
 
 # Configure headless Chrome options
 def get_chrome_options():
+    from selenium.webdriver.chrome.options import Options
+
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--no-sandbox")
@@ -129,56 +171,141 @@ def get_chrome_options():
     return chrome_options
 
 
-@tasks.loop(minutes=10)  # Check every 10 minutes to reduce server load
-async def check_for_new_grades():
-    # Get all users from database
+# Start a headless Chrome session, loading the scraping stack on first use
+def create_driver():
+    global chromedriver_path
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    # Use webdriver_manager to handle chromedriver installation, once per process
+    if chromedriver_path is None:
+        # Scrape threads start together, so only one of them may download the driver
+        with chromedriver_lock:
+            if chromedriver_path is None:
+                from webdriver_manager.chrome import ChromeDriverManager
+                chromedriver_path = ChromeDriverManager().install()
+
+    return webdriver.Chrome(service=Service(chromedriver_path), options=get_chrome_options())
+
+
+# Get the ids of every user with stored credentials
+def get_all_user_ids():
     conn = get_db_connection()
-    users = conn.execute("SELECT user_id FROM users").fetchall()
+    rows = conn.execute("SELECT user_id FROM users ORDER BY user_id").fetchall()
     conn.close()
+    return [row["user_id"] for row in rows]
 
-    for user_row in users:
-        user_id = user_row["user_id"]
-        try:
-            # Get credentials from database
-            creds = get_credentials(user_id)
-            if not creds:
-                continue
 
-            # Fetch current grades
-            grades = await asyncio.to_thread(fetch_grades, creds['email'], creds['password'])
+# Find grades that weren't in the last check
+def find_new_grades(grades, last_grades):
+    return [grade for grade in grades if grade not in last_grades]
+
+
+# DM a user the grades that just came in
+async def notify_new_grades(user_id, new_grades):
+    user = await bot.fetch_user(user_id)
+    if user:
+        message = "New grades came in:\n" + "\n".join(new_grades)
+        await user.send(message)
+
+
+# Scrape a user's grades, reading their credentials only once the job has a scrape slot
+def fetch_user_grades(user_id):
+    creds = get_credentials(user_id)
+    if not creds:
+        return []
+    return fetch_grades(creds['email'], creds['password'])
 
-            if not grades:
-                continue
 
-            # Get the previously saved grades
-            last_grades = get_saved_grades(user_id)
+# Check one user for new grades and DM them anything that came in
+async def check_user_grades(user_id):
+    try:
+        # Fetch current grades in the background lane
+        grades = await scrape_scheduler.run(BACKGROUND, fetch_user_grades, user_id)
+
+        if not grades:
+            return
 
-            # Check if the grades have changed since the last check
-            if last_grades:
-                # Find new grades that weren't in the last check
-                new_grades = [grade for grade in grades if grade not in last_grades]
+        # Skip users who ran /forget while their scrape was in flight
+        if not get_credentials(user_id):
+            return
 
-                if new_grades:
-                    # Send only the new grades
-                    user = await bot.fetch_user(user_id)
-                    if user:
-                        message = "New grades came in:\n" + "\n".join(new_grades)
-                        await user.send(message)
+        # Get the previously saved grades
+        last_grades = get_saved_grades(user_id)
 
-            # Update the grades in the database
+        # Check if the grades have changed since the last check
+        if last_grades:
+            # Find new grades that weren't in the last check
+            new_grades = find_new_grades(grades, last_grades)
+
+            if new_grades:
+                # Send only the new grades
+                await notify_new_grades(user_id, new_grades)
+
+        # Update the grades in the database, unless the user was deleted while we notified them
+        if get_credentials(user_id):
             save_grades(user_id, grades)
 
-        except Exception as e:
-            print(f"Error checking grades for user {user_id}: {e}")
-            traceback.print_exc()
+    except Exception as e:
+        print(f"Error checking grades for user {user_id}: {e}")
+        traceback.print_exc()
+
+
+@tasks.loop(minutes=SWEEP_INTERVAL_MINUTES)  # Check every 10 minutes to reduce server load
+async def check_for_new_grades():
+    # Get all users from database, resuming an interrupted sweep where it left off
+    user_ids = get_all_user_ids()
+    cursor = get_state("sweep_cursor")
+    if cursor is None:
+        set_state("last_sweep_started", time.time())
+    else:
+        user_ids = [user_id for user_id in user_ids if user_id > int(cursor)]
+
+    # Users finish out of order, so the cursor only moves past a fully checked prefix
+    checked = set()
+    next_index = 0
+
+    async def check_and_advance(user_id):
+        nonlocal next_index
+        await check_user_grades(user_id)
+        checked.add(user_id)
+        advanced = False
+        while next_index < len(user_ids) and user_ids[next_index] in checked:
+            next_index += 1
+            advanced = True
+        if advanced:
+            # Remember progress so a restart doesn't re-scrape everyone
+            set_state("sweep_cursor", user_ids[next_index - 1])
+
+    # The scheduler caps how many of these scrape at once (SWEEP_WORKERS)
+    await asyncio.gather(*(check_and_advance(user_id) for user_id in user_ids))
+
+    set_state("sweep_cursor", None)
+    print(f"Sweep finished for {len(user_ids)} user(s)\n{scrape_scheduler.format_latency_summary()}")
+
+
+# Wait out the rest of the interval since the last sweep instead of sweeping on every restart
+@check_for_new_grades.before_loop
+async def resume_sweep_schedule():
+    last_started = get_state("last_sweep_started")
+    if last_started is None or get_state("sweep_cursor") is not None:
+        return
+
+    remaining = float(last_started) + SWEEP_INTERVAL_MINUTES * 60 - time.time()
+    if remaining > 0:
+        print(f"Resuming sweep schedule, next sweep in {remaining:.0f}s")
+        await asyncio.sleep(remaining)
 
 
 def fetch_averages(email, password):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     driver = None
     try:
-        # Use webdriver_manager to handle chromedriver installation
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=get_chrome_options())
+        driver = create_driver()
         wait = WebDriverWait(driver, 15)  # Extended timeout
 
         driver.get("https://cecce.myontarioedu.ca/aspen")
@@ -232,11 +359,14 @@ def fetch_averages(email, password):
 
 
 def fetch_grades(email, password):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     driver = None
     try:
-        # Use webdriver_manager to handle chromedriver installation
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=get_chrome_options())
+        driver = create_driver()
         wait = WebDriverWait(driver, 15)  # Extended timeout
 
         driver.get("https://cecce.myontarioedu.ca/aspen")
@@ -351,6 +481,16 @@ def fetch_grades(email, password):
             driver.quit()
 
 
+# Hash the slash command definitions so unchanged trees don't get resynced
+def get_command_tree_hash():
+    # Hash exactly what sync() sends, plus the application it is sent to
+    commands_data = {
+        "application_id": bot.application_id,
+        "commands": [command.to_dict(bot.tree) for command in bot.tree.get_commands()],
+    }
+    return hashlib.sha256(json.dumps(commands_data, sort_keys=True).encode()).hexdigest()
+
+
 @bot.event
 async def on_ready():
     print(f"{bot.user} has connected to Discord!")
@@ -358,12 +498,18 @@ async def on_ready():
         # Initialize database
         init_db()
 
-        # Sync commands
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-
-        # Start grade checking task
-        check_for_new_grades.start()
+        # Sync commands only when their definitions changed since the last sync
+        command_hash = get_command_tree_hash()
+        if get_state("command_tree_hash") != command_hash:
+            synced = await bot.tree.sync()
+            set_state("command_tree_hash", command_hash)
+            print(f"Synced {len(synced)} command(s)")
+        else:
+            print("Command tree unchanged, skipping sync")
+
+        # Start grade checking task (on_ready fires again on reconnects)
+        if not check_for_new_grades.is_running():
+            check_for_new_grades.start()
     except Exception as e:
         print(f"Error during startup: {e}")
         traceback.print_exc()
@@ -426,7 +572,7 @@ async def dm_setup(ctx):
         # Try fetching grades immediately to verify credentials
         try:
             await ctx.send("Testing your credentials now, please wait...")
-            grades = await asyncio.to_thread(fetch_grades, email, password)
+            grades = await scrape_scheduler.run(INTERACTIVE, fetch_grades, email, password)
 
             if grades:
                 # Save initial grades to database
@@ -529,7 +675,7 @@ async def setup(interaction: discord.Interaction):
             # Try fetching grades immediately to verify credentials
             try:
                 await interaction.user.dm_channel.send("Testing your credentials now, please wait...")
-                grades = await asyncio.to_thread(fetch_grades, email, password)
+                grades = await scrape_scheduler.run(INTERACTIVE, fetch_grades, email, password)
 
                 if grades:
                     # Save initial grades to database
@@ -581,7 +727,7 @@ async def grades(interaction: discord.Interaction):
     creds = get_credentials(interaction.user.id)
     if creds:
         try:
-            grades = await asyncio.to_thread(fetch_grades, creds['email'], creds['password'])
+            grades = await scrape_scheduler.run(INTERACTIVE, fetch_grades, creds['email'], creds['password'])
 
             if grades:
                 # Format grades nicely
@@ -612,7 +758,7 @@ async def grades_command(ctx):
         await ctx.send("Fetching your grades, please wait...")
 
         try:
-            grades = await asyncio.to_thread(fetch_grades, creds['email'], creds['password'])
+            grades = await scrape_scheduler.run(INTERACTIVE, fetch_grades, creds['email'], creds['password'])
 
             if grades:
                 # Format grades nicely
@@ -662,7 +808,7 @@ async def averages(interaction: discord.Interaction):
     if creds:
         try:
             # Call fetch_averages
-            averages = await asyncio.to_thread(fetch_averages, creds['email'], creds['password'])
+            averages = await scrape_scheduler.run(INTERACTIVE, fetch_averages, creds['email'], creds['password'])
 
             if averages:
                 # Format averages nicely
@@ -694,7 +840,7 @@ async def averages_command(ctx):
 
         try:
             # Call fetch_averages
-            averages = await asyncio.to_thread(fetch_averages, creds['email'], creds['password'])
+            averages = await scrape_scheduler.run(INTERACTIVE, fetch_averages, creds['email'], creds['password'])
 
             if averages:
                 # Format averages nicely
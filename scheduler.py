@@ -0,0 +1,117 @@
+import asyncio
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Job classes, in priority order
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# How many recent jobs per class the latency metrics cover
+LATENCY_WINDOW = 1000
+
+
+# Runs blocking scrape jobs on a fixed thread pool with two priority classes.
+# Background jobs (the grade sweep) are capped at background_workers, and
+# reserved_interactive more slots are kept on top of that for interactive jobs
+# (user commands), which also start ahead of any queued background job. A user
+# only ever waits behind other users, not behind the sweep.
+class ScrapeScheduler:
+    def __init__(self, background_workers, reserved_interactive):
+        if background_workers < 1 or reserved_interactive < 1:
+            raise ValueError("background_workers and reserved_interactive must both be at least 1")
+        self.background_workers = background_workers
+        self.reserved_interactive = reserved_interactive
+        self.workers = background_workers + reserved_interactive
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scrape")
+        self.running = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.waiting = {INTERACTIVE: deque(), BACKGROUND: deque()}
+        self.latencies = {INTERACTIVE: deque(maxlen=LATENCY_WINDOW), BACKGROUND: deque(maxlen=LATENCY_WINDOW)}
+
+    # Run func(*args) in a worker thread once a slot for job_class is free
+    async def run(self, job_class, func, *args):
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+        slot = loop.create_future()
+        self.waiting[job_class].append(slot)
+        self._dispatch()
+
+        try:
+            await slot
+        except asyncio.CancelledError:
+            # The slot may have been granted right before we were cancelled
+            if slot.done() and not slot.cancelled():
+                self._release(job_class)
+            raise
+
+        started_at = time.perf_counter()
+
+        def finished(_):
+            loop.call_soon_threadsafe(self._finish, job_class, queued_at, started_at)
+
+        # Release the slot when the thread is actually done, even if the caller is cancelled
+        job = self.executor.submit(func, *args)
+        job.add_done_callback(finished)
+        return await asyncio.wrap_future(job)
+
+    def _can_start(self, job_class):
+        busy = self.running[INTERACTIVE] + self.running[BACKGROUND]
+        if busy >= self.workers:
+            return False
+        if job_class == INTERACTIVE:
+            return True
+        return not self.waiting[INTERACTIVE] and self.running[BACKGROUND] < self.background_workers
+
+    def _dispatch(self):
+        for job_class in (INTERACTIVE, BACKGROUND):
+            queue = self.waiting[job_class]
+            while queue and self._can_start(job_class):
+                slot = queue.popleft()
+                if slot.done():
+                    # Caller was cancelled while waiting
+                    continue
+                self.running[job_class] += 1
+                slot.set_result(None)
+
+    def _release(self, job_class):
+        self.running[job_class] -= 1
+        self._dispatch()
+
+    def _finish(self, job_class, queued_at, started_at):
+        finished_at = time.perf_counter()
+        self.latencies[job_class].append((started_at - queued_at, finished_at - queued_at))
+        self._release(job_class)
+
+    # Queue wait and end-to-end latency percentiles for each job class
+    def latency_summary(self):
+        summary = {}
+        for job_class, samples in self.latencies.items():
+            waits = sorted(wait for wait, _ in samples)
+            totals = sorted(total for _, total in samples)
+            summary[job_class] = {
+                "count": len(samples),
+                "pending": self.running[job_class] + len(self.waiting[job_class]),
+                "wait_p50": percentile(waits, 50),
+                "wait_p95": percentile(waits, 95),
+                "total_p50": percentile(totals, 50),
+                "total_p95": percentile(totals, 95),
+            }
+        return summary
+
+    def format_latency_summary(self):
+        lines = []
+        for job_class, stats in self.latency_summary().items():
+            lines.append(
+                f"{job_class}: {stats['count']} jobs, "
+                f"wait p50 {stats['wait_p50']:.2f}s p95 {stats['wait_p95']:.2f}s, "
+                f"total p50 {stats['total_p50']:.2f}s p95 {stats['total_p95']:.2f}s"
+            )
+        return "\n".join(lines)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
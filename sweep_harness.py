@@ -0,0 +1,299 @@
+"""Replay check_for_new_grades against a synthetic user population.
+
+Scrapes are replaced by recorded or generated results with a realistic
+latency distribution, Discord is stubbed, and the real SQLite layer from
+main.py is used against a throwaway database. Each sweep reports wall time
+along with the time spent in the DB, diffing and notification steps.
+Optional interactive requests can be fired during each sweep to check their
+latency under sweep load.
+
+    python sweep_harness.py --users 1000 --time-scale 0.001
+    python sweep_harness.py --interactive 50
+    python sweep_harness.py --recorded scrapes.json --profile sweep.prof
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import main
+from scheduler import INTERACTIVE
+
+# Rough shape of a real scrape: headless Chrome + Google login + page loads
+SCRAPE_MEDIAN_SECONDS = 12.0
+SCRAPE_SIGMA = 0.35
+NOTIFY_MEDIAN_SECONDS = 0.15
+NOTIFY_SIGMA = 0.5
+
+CLASSES = ["Math", "English", "French", "Science", "History", "Art", "Music", "Geography"]
+
+
+class SweepTimer:
+    """Accumulates time spent per sweep phase."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def reset(self):
+        self.totals.clear()
+        self.calls.clear()
+
+    def add(self, phase, elapsed):
+        self.totals[phase] += elapsed
+        self.calls[phase] += 1
+
+    def wrap(self, phase, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, phase, func):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start)
+        return timed
+
+
+def make_grade(rng, index):
+    class_name = rng.choice(CLASSES)
+    return f"Class: {class_name}, Test: Assignment {index}, Grade: {rng.randint(50, 100)}%"
+
+
+def lognormal(rng, median, sigma, scale):
+    return rng.lognormvariate(0, sigma) * median * scale
+
+
+class GeneratedScrapes:
+    """Scrape results for a synthetic population.
+
+    Every user starts with a set of existing grades; each sweep a fraction of
+    users gets a few new ones and a fraction of scrapes fail (empty result,
+    like fetch_grades does on error). Each scrape draws from its own RNG keyed
+    on the seed, email and sweep, so results don't depend on thread timing.
+    """
+
+    def __init__(self, seed, users, grades_per_user, new_grade_rate, failure_rate, time_scale):
+        self.seed_value = seed
+        self.rng = random.Random(seed)
+        self.sweep = 0
+        self.new_grade_rate = new_grade_rate
+        self.failure_rate = failure_rate
+        self.time_scale = time_scale
+        self.grades = {}
+        self.next_index = {}
+        for n in range(users):
+            email = f"student{n}@example.com"
+            self.grades[email] = [make_grade(self.rng, i) for i in range(grades_per_user)]
+            self.next_index[email] = grades_per_user
+
+    def seed(self, users):
+        return [(f"student{n}@example.com", list(self.grades[f"student{n}@example.com"])) for n in range(users)]
+
+    def advance(self):
+        # Post new grades for some users before the next sweep
+        self.sweep += 1
+        for email, grades in self.grades.items():
+            if self.rng.random() < self.new_grade_rate:
+                for _ in range(self.rng.randint(1, 3)):
+                    grades.append(make_grade(self.rng, self.next_index[email]))
+                    self.next_index[email] += 1
+
+    def fetch_grades(self, email, password):
+        rng = random.Random(f"{self.seed_value}:{email}:{self.sweep}")
+        time.sleep(lognormal(rng, SCRAPE_MEDIAN_SECONDS, SCRAPE_SIGMA, self.time_scale))
+        if rng.random() < self.failure_rate:
+            return []
+        return list(self.grades.get(email, []))
+
+
+class RecordedScrapes:
+    """Replays recorded scrape results round-robin across users.
+
+    The file is a JSON list of {"latency": seconds, "grades": [...]} entries.
+    """
+
+    def __init__(self, path, time_scale):
+        with open(path) as f:
+            self.records = json.load(f)
+        if not self.records:
+            raise ValueError(f"No recorded scrapes in {path}")
+        self.time_scale = time_scale
+        self.sweep = 0
+
+    def seed(self, users):
+        return [(f"student{n}@example.com", []) for n in range(users)]
+
+    def advance(self):
+        self.sweep += 1
+
+    def fetch_grades(self, email, password):
+        n = int(email[len("student"):].split("@")[0])
+        record = self.records[(n + self.sweep) % len(self.records)]
+        time.sleep(record.get("latency", 0) * self.time_scale)
+        return list(record.get("grades", []))
+
+
+class StubUser:
+    def __init__(self, rng, time_scale, sent):
+        self.rng = rng
+        self.time_scale = time_scale
+        self.sent = sent
+
+    async def send(self, message):
+        await asyncio.sleep(lognormal(self.rng, NOTIFY_MEDIAN_SECONDS, NOTIFY_SIGMA, self.time_scale))
+        self.sent.append(message)
+
+
+def seed_database(population):
+    main.init_db()
+    conn = main.get_db_connection()
+    for user_id, (email, grades) in enumerate(population, start=1):
+        conn.execute(
+            "INSERT OR REPLACE INTO users (user_id, email, password) VALUES (?, ?, ?)",
+            (user_id, email, "password")
+        )
+        if grades:
+            conn.execute(
+                "INSERT OR REPLACE INTO grades (user_id, grades_data) VALUES (?, ?)",
+                (user_id, json.dumps(grades))
+            )
+    conn.commit()
+    conn.close()
+
+
+def install_stubs(scrapes, timer, rng, time_scale, sent):
+    main.fetch_grades = timer.wrap("scrape", scrapes.fetch_grades)
+
+    for name in ("get_all_user_ids", "get_credentials", "get_saved_grades", "save_grades", "get_state", "set_state"):
+        setattr(main, name, timer.wrap("db", getattr(main, name)))
+
+    main.find_new_grades = timer.wrap("diff", main.find_new_grades)
+
+    async def fetch_user(user_id):
+        return StubUser(rng, time_scale, sent)
+
+    main.bot.fetch_user = fetch_user
+    main.notify_new_grades = timer.wrap_async("notify", main.notify_new_grades)
+
+
+# Simulate users running /grades while the sweep is going
+async def interactive_load(scrapes, rng, count, users, time_scale):
+    jobs = []
+    for _ in range(count):
+        await asyncio.sleep(rng.expovariate(1 / (SCRAPE_MEDIAN_SECONDS * time_scale)))
+        email = f"student{rng.randrange(users)}@example.com"
+        jobs.append(asyncio.create_task(
+            main.scrape_scheduler.run(INTERACTIVE, scrapes.fetch_grades, email, "password")))
+    await asyncio.gather(*jobs)
+
+
+async def timed_sweep():
+    start = time.perf_counter()
+    await main.check_for_new_grades()
+    return time.perf_counter() - start
+
+
+async def run_sweeps(scrapes, timer, sweeps, sent, rng, interactive, users, time_scale):
+    results = []
+    for sweep in range(sweeps):
+        if sweep:
+            scrapes.advance()
+        timer.reset()
+        sent.clear()
+        wall, _ = await asyncio.gather(
+            timed_sweep(),
+            interactive_load(scrapes, rng, interactive, users, time_scale),
+        )
+        results.append((wall, dict(timer.totals), dict(timer.calls), len(sent)))
+    return results
+
+
+def print_report(results, users):
+    print(f"\n{'sweep':>5} {'wall s':>9} {'scrape s':>9} {'db s':>8} {'diff s':>8} {'notify s':>9} {'DMs':>5}")
+    for n, (wall, totals, calls, dms) in enumerate(results, start=1):
+        print(f"{n:>5} {wall:>9.3f} {totals.get('scrape', 0):>9.3f} {totals.get('db', 0):>8.3f} "
+              f"{totals.get('diff', 0):>8.4f} {totals.get('notify', 0):>9.3f} {dms:>5}")
+    walls = [r[0] for r in results]
+    print(f"\n{users} users, {len(results)} sweep(s), mean wall {sum(walls) / len(walls):.3f}s")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay check_for_new_grades against a synthetic population")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sweeps", type=int, default=3)
+    parser.add_argument("--grades-per-user", type=int, default=40)
+    parser.add_argument("--new-grade-rate", type=float, default=0.05,
+                        help="fraction of users that get new grades between sweeps")
+    parser.add_argument("--failure-rate", type=float, default=0.02,
+                        help="fraction of scrapes that fail and return nothing")
+    parser.add_argument("--time-scale", type=float, default=0.001,
+                        help="multiplier on simulated scrape/Discord latency (1.0 = real time)")
+    parser.add_argument("--recorded", help="JSON file of recorded scrapes to replay instead of generated ones")
+    parser.add_argument("--interactive", type=int, default=0,
+                        help="interactive scrapes to fire during each sweep")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="new SQLite file to keep for inspection (default: a temporary file)")
+    parser.add_argument("--profile", help="write cProfile stats to this file and print the top entries")
+    args = parser.parse_args()
+
+    # The harness seeds fake users and sweep state, so never point it at a real database
+    if args.db and os.path.exists(args.db):
+        parser.error(f"--db {args.db} already exists; the harness only writes to a new file")
+
+    if args.recorded:
+        scrapes = RecordedScrapes(args.recorded, args.time_scale)
+    else:
+        scrapes = GeneratedScrapes(args.seed, args.users, args.grades_per_user, args.new_grade_rate,
+                                   args.failure_rate, args.time_scale)
+
+    tmpdir = None
+    if args.db:
+        main.DB_PATH = args.db
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        main.DB_PATH = os.path.join(tmpdir.name, "harness.db")
+
+    try:
+        seed_database(scrapes.seed(args.users))
+
+        timer = SweepTimer()
+        sent = []
+        install_stubs(scrapes, timer, random.Random(f"{args.seed}:notify"), args.time_scale, sent)
+
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        interactive_rng = random.Random(f"{args.seed}:interactive")
+        results = asyncio.run(run_sweeps(scrapes, timer, args.sweeps, sent, interactive_rng, args.interactive,
+                                         args.users, args.time_scale))
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+        print_report(results, args.users)
+        print(f"\nScheduler latency:\n{main.scrape_scheduler.format_latency_summary()}")
+
+        if profiler:
+            print(f"\nProfile written to {args.profile}")
+            pstats.Stats(args.profile).sort_stats("cumulative").print_stats(20)
+    finally:
+        if tmpdir:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()